@@ -1,4 +1,41 @@
-from .rewriting import rewrite
-from .reader import literal_to_parts
-from .fts import use_fts
-from .rdf2vec import use_rdf2vec
+import importlib
+
+# The submodules are only imported when first used, so that a process that only does
+# FTS rewriting does not have to load voyager and numpy.
+_LAZY_ATTRIBUTES = {
+    "rewrite": "rewriting",
+    "rewrite_async": "rewriting",
+    "with_timeout": "rewriting",
+    "literal_to_parts": "reader",
+    "use_fts": "fts",
+    "use_fts_async": "fts",
+    "use_rdf2vec": "rdf2vec",
+    "use_rdf2vec_async": "rdf2vec",
+}
+_SUBMODULES = (
+    "benchmark",
+    "bloomtyper",
+    "columnar",
+    "fts",
+    "metrics",
+    "rdf2vec",
+    "reader",
+    "rewriting",
+)
+
+__all__ = list(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name: str):
+    if name in _LAZY_ATTRIBUTES:
+        module = importlib.import_module(f".{_LAZY_ATTRIBUTES[name]}", __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    if name in _SUBMODULES:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES) | set(_SUBMODULES))
@@ -1,15 +1,31 @@
 import os, sys, time
-from .fts import build_fts_index
-from .rdf2vec import build_rdf2vec_index
-from .bloomtyper import build_bloomtyper_index
 
 input_filepath = os.getenv("INPUT_FILEPATH", ".")
 
 input_filepaths = []
 for root, dirs, files in os.walk(input_filepath):
     for file in files:
-        if file.endswith(".nt") or file.endswith(".nt.gz"):
+        if file.endswith((".nt", ".nt.gz", ".nt.bz2", ".nt.zst")):
             input_filepaths.append(os.path.join(root, file))
+
+# Optionally convert the input files once to a columnar triple file, which the index
+# builders can then read without parsing the n-triples again. It is written again when
+# input files were added, removed or changed since.
+columnar_path = os.getenv("COLUMNAR_PATH")
+if columnar_path:
+    if len(input_filepaths) > 0:
+        from .columnar import build_columnar, columnar_is_current
+
+        if not columnar_is_current(columnar_path, input_filepaths):
+            if os.path.exists(columnar_path):
+                sys.stderr.write(
+                    f"The input files changed since {columnar_path} was written\n"
+                )
+            sys.stderr.write(f"Writing columnar triples to {columnar_path}\n")
+            build_columnar(input_filepaths, columnar_path)
+    if os.path.exists(columnar_path):
+        input_filepaths = [columnar_path]
+
 if len(input_filepaths) == 0:
     sys.stderr.write(
         f"No n-triple files found in the input directory: {input_filepath}\n"
@@ -20,19 +36,33 @@ else:
 
 fts_sqlite_path = os.getenv("FTS_SQLITE_PATH")
 if fts_sqlite_path:
+    from .fts import build_fts_index
+
     build_fts_index(input_filepaths, fts_sqlite_path)
 
 rdf2vec_index_path = os.getenv("RDF2VEC_INDEX_PATH")
 if rdf2vec_index_path:
+    from .rdf2vec import build_rdf2vec_index
+
     build_rdf2vec_index(input_filepaths, rdf2vec_index_path)
 
 bloomtyper_index_path = os.getenv("BLOOMTYPER_INDEX_PATH")
-if bloomtyper_index_path:
-    build_bloomtyper_index(input_filepaths, bloomtyper_index_path)
+bloomtyper_store_path = os.getenv("BLOOMTYPER_STORE_PATH")
+if bloomtyper_index_path or bloomtyper_store_path:
+    from .bloomtyper import build_bloomtyper_index
+
+    build_bloomtyper_index(
+        input_filepaths, bloomtyper_index_path, store_path=bloomtyper_store_path
+    )
 
-if not fts_sqlite_path and not rdf2vec_index_path and not bloomtyper_index_path:
+if (
+    not fts_sqlite_path
+    and not rdf2vec_index_path
+    and not bloomtyper_index_path
+    and not bloomtyper_store_path
+):
     sys.stderr.write(
-        "Please set either the FTS_SQLITE_PATH or RDF2VEC_INDEX_PATH environment variables to build an index\n"
+        "Please set one or more of the FTS_SQLITE_PATH, RDF2VEC_INDEX_PATH, BLOOMTYPER_INDEX_PATH or BLOOMTYPER_STORE_PATH environment variables to build an index\n"
     )
     sys.exit(1)
 else:
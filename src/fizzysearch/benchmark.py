@@ -0,0 +1,415 @@
+import os, sys, json, math, time, random, logging, argparse, platform, resource, statistics
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from .reader import read_nt
+
+RDF_TYPE = "<http://www.w3.org/1999/02/22-rdf-syntax-ns#type>"
+RDFS_LABEL = "<http://www.w3.org/2000/01/rdf-schema#label>"
+RDFS_COMMENT = "<http://www.w3.org/2000/01/rdf-schema#comment>"
+RDFS_SUBCLASSOF = "<http://www.w3.org/2000/01/rdf-schema#subClassOf>"
+SKOS_PREFLABEL = "<http://www.w3.org/2004/02/skos/core#prefLabel>"
+OWL_CLASS = "<http://www.w3.org/2002/07/owl#Class>"
+OWL_RESTRICTION = "<http://www.w3.org/2002/07/owl#Restriction>"
+OWL_ONPROPERTY = "<http://www.w3.org/2002/07/owl#onProperty>"
+OWL_SOMEVALUESFROM = "<http://www.w3.org/2002/07/owl#someValuesFrom>"
+BENCH_NS = "http://example.org/fizzybench#"
+
+FTS_PREDICATE = "https://fizzysearch.ise.fiz-karlsruhe.de/fts"
+FTS_LANGUAGE_PREDICATE = "https://fizzysearch.ise.fiz-karlsruhe.de/fts_language"
+RDF2VEC_PREDICATE = "https://fizzysearch.ise.fiz-karlsruhe.de/rdf2vec"
+
+WORDS = [
+    ("Mozzarella", "Queijo"),
+    ("Tomato", "Tomate"),
+    ("Mushroom", "Cogumelo"),
+    ("Pepper", "Pimenta"),
+    ("Olive", "Azeitona"),
+    ("Onion", "Cebola"),
+    ("Ham", "Presunto"),
+    ("Garlic", "Alho"),
+    ("Spinach", "Espinafre"),
+    ("Anchovy", "Anchova"),
+    ("Caper", "Alcaparra"),
+    ("Rocket", "Rucula"),
+    ("Sausage", "Salsicha"),
+    ("Chicken", "Frango"),
+    ("Pineapple", "Abacaxi"),
+    ("Artichoke", "Alcachofra"),
+]
+
+
+def generate_nt(path: str, triples: int = 100000, seed: int = 42):
+    """Write a synthetic N-Triples file shaped like pizza.nt with roughly the given number of triples"""
+    rnd = random.Random(seed)
+    count = 0
+    entity = 0
+    with open(path, "w", encoding="utf8") as F:
+
+        def emit(s, p, o):
+            nonlocal count
+            F.write(f"{s} {p} {o} .\n")
+            count += 1
+
+        for i, (en, pt) in enumerate(WORDS):
+            topping = f"<{BENCH_NS}{en}Topping>"
+            emit(topping, RDF_TYPE, OWL_CLASS)
+            emit(topping, RDFS_LABEL, f'"{en}Topping"@en')
+            emit(topping, RDFS_LABEL, f'"Cobertura{pt}"@pt')
+
+        while count < triples:
+            entity += 1
+            first, second = rnd.sample(WORDS, 2)
+            pizza = f"<{BENCH_NS}Pizza{entity}>"
+            emit(pizza, RDF_TYPE, OWL_CLASS)
+            emit(pizza, RDFS_LABEL, f'"{first[0]} {second[0]} Pizza {entity}"@en')
+            emit(pizza, RDFS_LABEL, f'"Pizza{first[1]}Com{second[1]}{entity}"@pt')
+            emit(pizza, SKOS_PREFLABEL, f'"{first[0]} {second[0]}"@en')
+            if entity > 1:
+                parent = rnd.randint(max(1, entity // 2), entity - 1)
+                emit(pizza, RDFS_SUBCLASSOF, f"<{BENCH_NS}Pizza{parent}>")
+            for word in (first, second):
+                bnode = f"_:bench{entity}x{word[0]}"
+                emit(pizza, RDFS_SUBCLASSOF, bnode)
+                emit(bnode, RDF_TYPE, OWL_RESTRICTION)
+                emit(bnode, OWL_ONPROPERTY, f"<{BENCH_NS}hasTopping>")
+                emit(bnode, OWL_SOMEVALUESFROM, f"<{BENCH_NS}{word[0]}Topping>")
+            if rnd.random() < 0.1:
+                emit(
+                    pizza,
+                    RDFS_COMMENT,
+                    f'"A pizza with {first[0].lower()} and {second[0].lower()}, number {entity} of the benchmark."@en',
+                )
+
+    return {"path": path, "triples": count, "entities": entity, "seed": seed}
+
+
+# Which builders read the triples with a blank node subject too, their throughput is
+# measured against that larger count
+BUILDER_BLANK_NODES = {"fts": True, "rdf2vec": False, "bloomtyper": False}
+
+
+def count_triples(triplefile_paths: list, blank_nodes: bool = False):
+    return sum(1 for _ in read_nt(triplefile_paths, blank_nodes=blank_nodes))
+
+
+def peak_rss_bytes():
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, kilobytes elsewhere
+    if sys.platform == "darwin":
+        return maxrss
+    return maxrss * 1024
+
+
+def index_size_bytes(index_path: str):
+    directory = os.path.dirname(os.path.abspath(index_path))
+    basename = os.path.basename(index_path)
+    return sum(
+        os.path.getsize(os.path.join(directory, filename))
+        for filename in os.listdir(directory)
+        if filename.startswith(basename)
+    )
+
+
+def _run_builder(name: str, triplefile_paths: list, index_path: str):
+    if name == "fts":
+        from .fts import build_fts_index as builder
+    elif name == "rdf2vec":
+        from .rdf2vec import build_rdf2vec_index as builder
+    elif name == "bloomtyper":
+        from .bloomtyper import build_bloomtyper_index as builder
+    else:
+        raise ValueError(f"Unknown builder: {name}")
+
+    start_time = time.perf_counter()
+    builder(triplefile_paths, index_path)
+    elapsed = time.perf_counter() - start_time
+    return elapsed, peak_rss_bytes()
+
+
+def bench_builder(name: str, triplefile_paths: list, index_path: str, triples: int):
+    """Run one index builder in a fresh process, so the peak RSS is its own"""
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        try:
+            elapsed, peak_rss = executor.submit(
+                _run_builder, name, triplefile_paths, index_path
+            ).result()
+        except Exception as e:
+            logging.exception(f"Benchmarking {name} builder failed")
+            return {"error": repr(e)}
+    return {
+        "seconds": elapsed,
+        "triples": triples,
+        "triples_per_second": triples / elapsed if elapsed > 0 else None,
+        "peak_rss_bytes": peak_rss,
+        "index_size_bytes": index_size_bytes(index_path),
+    }
+
+
+def percentile(values: list, pct: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    # nearest rank
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def make_query_mix(
+    triplefile_paths: list, predicates: list, size: int = 1000, seed: int = 42
+):
+    """Build a list of SPARQL queries using labels and IRIs found in the given triples"""
+    labels = []
+    iris = []
+    for s, p, o, _ in read_nt(triplefile_paths):
+        if p == RDFS_LABEL and o.startswith('"'):
+            labels.append(o)
+        elif p == RDF_TYPE:
+            iris.append(s)
+
+    rnd = random.Random(seed)
+    queries = []
+    for _ in range(size):
+        predicate = rnd.choice(predicates)
+        if predicate == RDF2VEC_PREDICATE:
+            if not iris:
+                continue
+            obj = rnd.choice(iris)
+        else:
+            if not labels:
+                continue
+            label = rnd.choice(labels)
+            end_index = label.rfind('"')
+            words = label[1:end_index].split(" ")
+            if predicate == FTS_LANGUAGE_PREDICATE:
+                obj = '"' + rnd.choice(words) + '"' + label[end_index + 1 :]
+            else:
+                obj = '"' + rnd.choice(words) + '"'
+        if rnd.random() < 0.5:
+            queries.append(f"SELECT ?s WHERE {{ ?s <{predicate}> {obj} . }} LIMIT 10")
+        else:
+            queries.append(
+                f"PREFIX fizzy: <{predicate.rsplit('/', 1)[0]}/>\n"
+                + f"# benchmark query\nSELECT * WHERE {{ ?s fizzy:{predicate.rsplit('/', 1)[1]} {obj} . ?s ?p ?o }}"
+            )
+    return queries
+
+
+def bench_rewrite(queries: list, predicate_map: dict, concurrency: int = 1):
+    """Run all queries through rewrite with the given number of concurrent workers and report latencies"""
+    from .rewriting import rewrite
+
+    def timed(query):
+        start_time = time.perf_counter()
+        try:
+            rewrite(query, predicate_map)
+            error = False
+        except Exception:
+            error = True
+        return time.perf_counter() - start_time, error
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(timed, queries))
+    elapsed = time.perf_counter() - start_time
+
+    latencies = [latency for latency, _ in outcomes]
+    return {
+        "concurrency": concurrency,
+        "queries": len(queries),
+        "errors": sum(1 for _, error in outcomes if error),
+        "seconds": elapsed,
+        "queries_per_second": len(queries) / elapsed if elapsed > 0 else None,
+        "p50_ms": _ms(percentile(latencies, 50)),
+        "p95_ms": _ms(percentile(latencies, 95)),
+        "p99_ms": _ms(percentile(latencies, 99)),
+        "max_ms": _ms(max(latencies) if latencies else None),
+    }
+
+
+def _ms(seconds):
+    if seconds is None:
+        return None
+    return seconds * 1000
+
+
+IMPORT_SCENARIOS = {
+    "package": "import fizzysearch",
+    "fts_rewrite": "from fizzysearch import rewrite, use_fts",
+    "fts_rewrite_first_query": "from fizzysearch import rewrite, use_fts\nrewrite('SELECT ?s WHERE { ?s ?p ?o }')",
+    # what importing the package used to cost, before the submodules were loaded lazily
+    "eager": "import fizzysearch.rewriting, fizzysearch.fts, fizzysearch.rdf2vec\nimport voyager, numpy\nfizzysearch.rewriting.get_sparql()",
+}
+HEAVY_MODULES = ("numpy", "voyager", "tree_sitter", "asyncio", "fizzysearch.rewriting")
+
+
+def bench_import(repeat: int = 5):
+    """Time each import scenario in a fresh interpreter, and note which heavy modules it loaded"""
+    package_parent = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    report = {}
+    for name, code in IMPORT_SCENARIOS.items():
+        script = (
+            f"import sys, time, json\nsys.path.insert(0, {package_parent!r})\n"
+            + "start = time.perf_counter()\n"
+            + code
+            + "\nelapsed = time.perf_counter() - start\n"
+            + f"print(json.dumps({{'seconds': elapsed, 'modules': [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))\n"
+        )
+        timings = []
+        modules = None
+        for _ in range(repeat):
+            completed = subprocess.run(
+                [sys.executable, "-c", script], capture_output=True, text=True
+            )
+            if completed.returncode != 0:
+                report[name] = {"error": completed.stderr.strip().split("\n")[-1]}
+                break
+            outcome = json.loads(completed.stdout.strip().split("\n")[-1])
+            timings.append(outcome["seconds"])
+            modules = outcome["modules"]
+        else:
+            report[name] = {
+                "median_ms": _ms(statistics.median(timings)) if timings else None,
+                "min_ms": _ms(min(timings)) if timings else None,
+                "modules": modules,
+            }
+    return report
+
+
+def package_version():
+    try:
+        from importlib.metadata import version
+
+        return version("fizzysearch")
+    except Exception:
+        return None
+
+
+def run(args):
+    os.makedirs(args.workdir, exist_ok=True)
+    report = {
+        "fizzysearch": package_version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "builders": {},
+        "rewrite": [],
+    }
+
+    if args.input:
+        triplefile_paths = args.input
+        report["dataset"] = {"paths": triplefile_paths}
+    else:
+        dataset_path = os.path.join(args.workdir, f"bench_{args.triples}.nt")
+        sys.stderr.write(f"Generating {args.triples} triples in {dataset_path}\n")
+        report["dataset"] = generate_nt(dataset_path, args.triples, args.seed)
+        triplefile_paths = [dataset_path]
+    triples = {
+        blank_nodes: count_triples(triplefile_paths, blank_nodes)
+        for blank_nodes in (False, True)
+    }
+    report["dataset"]["parsed_triples"] = triples[False]
+    report["dataset"]["parsed_triples_with_blank_nodes"] = triples[True]
+
+    if args.import_repeat > 0:
+        sys.stderr.write("Benchmarking import times\n")
+        report["import"] = bench_import(args.import_repeat)
+
+    index_paths = {}
+    for name in args.builders:
+        if not name:
+            continue
+        index_path = os.path.join(args.workdir, f"bench.{name}")
+        for filename in os.listdir(args.workdir):
+            if filename.startswith(f"bench.{name}"):
+                os.remove(os.path.join(args.workdir, filename))
+        sys.stderr.write(f"Benchmarking the {name} builder\n")
+        report["builders"][name] = bench_builder(
+            name,
+            triplefile_paths,
+            index_path,
+            triples[BUILDER_BLANK_NODES.get(name, False)],
+        )
+        if "error" not in report["builders"][name]:
+            index_paths[name] = index_path
+
+    predicate_map = {}
+    if "fts" in index_paths:
+        from .fts import use_fts
+
+        predicate_map[FTS_PREDICATE] = use_fts(index_paths["fts"])
+        predicate_map[FTS_LANGUAGE_PREDICATE] = use_fts(
+            index_paths["fts"], use_language=True
+        )
+    if "rdf2vec" in index_paths:
+        from .rdf2vec import use_rdf2vec
+
+        predicate_map[RDF2VEC_PREDICATE] = use_rdf2vec(index_paths["rdf2vec"])
+
+    predicates = list(predicate_map)
+    for predicate in predicates:
+        # the prefixed form used by half of the generated queries
+        predicate_map["fizzy:" + predicate.rsplit("/", 1)[1]] = predicate_map[predicate]
+
+    if predicate_map and args.queries > 0:
+        queries = make_query_mix(triplefile_paths, predicates, args.queries, args.seed)
+        for concurrency in args.concurrency:
+            sys.stderr.write(
+                f"Benchmarking rewrite with {len(queries)} queries at concurrency {concurrency}\n"
+            )
+            report["rewrite"].append(bench_rewrite(queries, predicate_map, concurrency))
+
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m fizzysearch.benchmark",
+        description="Benchmark the fizzysearch index builders and the query rewriter",
+    )
+    parser.add_argument(
+        "--input",
+        nargs="*",
+        help="Existing n-triple files to use instead of a generated dataset",
+    )
+    parser.add_argument(
+        "--triples", type=int, default=100000, help="Size of the generated dataset"
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workdir", default="bench_output")
+    parser.add_argument(
+        "--builders",
+        type=lambda v: v.split(","),
+        default=["fts", "rdf2vec", "bloomtyper"],
+        help="Comma separated list of builders to run",
+    )
+    parser.add_argument(
+        "--queries", type=int, default=1000, help="Number of queries in the rewrite mix"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=lambda v: [int(c) for c in v.split(",")],
+        default=[1, 4, 16],
+        help="Comma separated list of concurrency levels for the rewrite benchmark",
+    )
+    parser.add_argument(
+        "--import-repeat",
+        type=int,
+        default=5,
+        help="How often to time each import scenario, 0 to skip",
+    )
+    parser.add_argument(
+        "--output", help="Write the JSON report to this file instead of stdout"
+    )
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    if args.output:
+        with open(args.output, "w") as F:
+            json.dump(report, F, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
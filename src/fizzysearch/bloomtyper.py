@@ -1,13 +1,26 @@
-import sqlite3, sys, time
+import os, sqlite3, sys, time, math, mmap, struct
 from typing import Union
 from rbloom import Bloom  # we want to use at least version 1.5.2
 from hashlib import sha256
 from .reader import read_nt
+from .metrics import METRICS
 
 DB_SCHEMA = """
 CREATE TABLE IF NOT EXISTS bloomtyper_index (predicate TEXT, size INTEGER, bloom BLOB);
 """
 
+# A bloomtyper store keeps all the filters in one file that is memory-mapped and probed
+# in place, so that worker processes share the filters through the page cache:
+#
+#   header | entries (one per filter) | predicate names | bit arrays (8 byte aligned)
+#
+# The filters use their own layout (not the rbloom one), with k bit positions
+# derived from the sha256 of the value by enhanced double hashing.
+STORE_MAGIC = b"FZBLOOM1"
+STORE_HEADER = struct.Struct("<8sQ")  # magic, number of filters
+# name offset, name length, number of hashes (k), number of items, number of bits (m), bits offset
+STORE_ENTRY = struct.Struct("<QIIQQQ")
+
 
 def get_db(bloomtyper_index: str):
     if isinstance(bloomtyper_index, str):
@@ -26,36 +39,49 @@ def hash_func(obj):
 
 
 def build_bloomtyper_index(
-    triplefile_paths: list, index_db_path: Union[str, sqlite3.Connection]
+    triplefile_paths: list,
+    index_db_path: Union[str, sqlite3.Connection, None],
+    store_path: str = None,
 ):
-    db = get_db(index_db_path)
+    """Build the SQLite bloomtyper index in index_db_path, and/or the memory-mapped
+    store (see MappedChecker) in store_path"""
+    db = get_db(index_db_path) if index_db_path is not None else None
     the_map = {}
     count = 0
     batch_interval = 30
     start_time = time.time()
     batch_time = start_time - (batch_interval * 2)
-    for s, p, o, triplefile_path in read_nt(triplefile_paths):
-        count += 1
-        if p == "<http://www.w3.org/1999/02/22-rdf-syntax-ns#type>":
-            the_map.setdefault(o.strip("<>"), set()).add(s.strip("<>"))
-            if time.time() - batch_time > batch_interval:
-                sys.stderr.write("\r" + " " * 80)
-                sys.stderr.write(
-                    f"\rFrom {triplefile_path} processed {count} triples in {int(time.time() - start_time)} seconds"
+    with METRICS.timer("bloomtyper_build_read"):
+        for s, p, o, triplefile_path in read_nt(triplefile_paths):
+            count += 1
+            if p == "<http://www.w3.org/1999/02/22-rdf-syntax-ns#type>":
+                the_map.setdefault(o.strip("<>"), set()).add(s.strip("<>"))
+                if time.time() - batch_time > batch_interval:
+                    sys.stderr.write("\r" + " " * 80)
+                    sys.stderr.write(
+                        f"\rFrom {triplefile_path} processed {count} triples in {int(time.time() - start_time)} seconds"
+                    )
+                    batch_time = time.time()
+
+    if store_path:
+        with METRICS.timer("bloomtyper_build_store"):
+            write_bloom_store(the_map, store_path)
+
+    if db is not None:
+        with METRICS.timer("bloomtyper_build_filters"):
+            for k, v in the_map.items():
+                bf = Bloom(len(v), 0.001, hash_func)
+                for vv in v:
+                    bf.add(vv)
+
+                outbuf = bf.save_bytes()
+                db.execute(
+                    "INSERT INTO bloomtyper_index (predicate, size, bloom) VALUES (?, ?, ?)",
+                    (k, len(v), outbuf),
                 )
-                batch_time = time.time()
-
-    for k, v in the_map.items():
-        bf = Bloom(len(v), 0.001, hash_func)
-        for vv in v:
-            bf.add(vv)
-
-        outbuf = bf.save_bytes()
-        db.execute(
-            "INSERT INTO bloomtyper_index (predicate, size, bloom) VALUES (?, ?, ?)",
-            (k, len(v), outbuf),
-        )
-    db.commit()
+            db.commit()
+    METRICS.incr("bloomtyper_build_triples", count)
+    METRICS.incr("bloomtyper_build_types", len(the_map))
     return count
 
 
@@ -75,6 +101,7 @@ class Checker:
             "SELECT predicate, bloom FROM bloomtyper_index WHERE predicate = ?",
             (predicate,),
         ):
+            METRICS.incr("bloomtyper_filter_loads")
             self.predicate_map[pred] = Bloom.load_bytes(bloom, hash_func)
             return self.predicate_map[pred]
 
@@ -98,3 +125,148 @@ class Checker:
 
     def __contains__(self, predicate):
         return predicate in self.predicate_map
+
+
+def bloom_hashes(value: str):
+    h = sha256(value.encode("utf8")).digest()
+    return int.from_bytes(h[:8], "little"), int.from_bytes(h[8:16], "little")
+
+
+def bloom_positions(h1: int, h2: int, k: int, m_bits: int):
+    # Enhanced double hashing (Dillinger and Manolios), plain double hashing gives
+    # far too many false positives for the small filters
+    x = h1 % m_bits
+    y = h2 % m_bits
+    for i in range(k):
+        yield x
+        x = (x + y) % m_bits
+        y = (y + i) % m_bits
+
+
+def bloom_parameters(size: int, error_rate: float = 0.001):
+    """The number of bits (a multiple of 64) and hashes for a filter with size items"""
+    size = max(size, 1)
+    m_bits = math.ceil(-size * math.log(error_rate) / (math.log(2) ** 2))
+    m_bits = max(64, (m_bits + 63) // 64 * 64)
+    k = max(1, round(m_bits / size * math.log(2)))
+    return m_bits, k
+
+
+def write_bloom_store(the_map: dict, store_path: str, error_rate: float = 0.001):
+    """Write a store with one filter per key of the_map, holding the values in its set"""
+    names = [name.encode("utf8") for name in the_map]
+    names_offset = STORE_HEADER.size + STORE_ENTRY.size * len(names)
+    bits_offset = names_offset + sum(len(name) for name in names)
+    bits_offset = (bits_offset + 7) // 8 * 8
+
+    entries = []
+    name_offset = names_offset
+    for name, values in zip(names, the_map.values()):
+        m_bits, k = bloom_parameters(len(values), error_rate)
+        entries.append((name_offset, len(name), k, len(values), m_bits, bits_offset))
+        name_offset += len(name)
+        bits_offset += m_bits // 8
+
+    tmp_path = store_path + ".tmp"
+    with open(tmp_path, "wb") as F:
+        F.write(STORE_HEADER.pack(STORE_MAGIC, len(entries)))
+        for entry in entries:
+            F.write(STORE_ENTRY.pack(*entry))
+        for name in names:
+            F.write(name)
+        F.write(b"\0" * (entries[0][5] - F.tell() if entries else 0))
+        for (_, _, k, _, m_bits, _), values in zip(entries, the_map.values()):
+            F.write(bloom_bits(values, k, m_bits))
+    os.replace(tmp_path, store_path)
+
+
+def bloom_bits(values, k: int, m_bits: int) -> bytes:
+    """The bit array of a filter holding values, the same bits bloom_positions gives,
+    but computed for all values at once"""
+    import numpy as np
+
+    hashes = np.frombuffer(
+        b"".join(sha256(value.encode("utf8")).digest()[:16] for value in values),
+        dtype="<u8",
+    ).reshape(-1, 2)
+    m = np.uint64(m_bits)
+    x = hashes[:, 0] % m
+    y = hashes[:, 1] % m
+    bits = np.zeros(m_bits, dtype=bool)
+    for i in range(k):
+        bits[x] = True
+        x = (x + y) % m
+        y = (y + np.uint64(i)) % m
+    return np.packbits(bits, bitorder="little").tobytes()
+
+
+class MappedBloom:
+    __slots__ = ("mm", "k", "size", "m_bits", "offset")
+
+    def __init__(self, mm, k: int, size: int, m_bits: int, offset: int):
+        self.mm = mm
+        self.k = k
+        self.size = size
+        self.m_bits = m_bits
+        self.offset = offset
+
+    def contains_hashes(self, h1: int, h2: int):
+        mm = self.mm
+        offset = self.offset
+        for bit in bloom_positions(h1, h2, self.k, self.m_bits):
+            if not mm[offset + (bit >> 3)] & (1 << (bit & 7)):
+                return False
+        return True
+
+    def __contains__(self, value: str):
+        return self.contains_hashes(*bloom_hashes(value))
+
+
+class MappedChecker:
+    """A Checker for a store written with build_bloomtyper_index(..., store_path=...).
+    Only the entry table is read on startup, the filters are probed in the mapped file.
+    """
+
+    def __init__(self, store_path: str):
+        with open(store_path, "rb") as F:
+            self.mm = mmap.mmap(F.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n_filters = STORE_HEADER.unpack_from(self.mm, 0)
+        if magic != STORE_MAGIC:
+            self.mm.close()
+            raise ValueError(f"{store_path} is not a bloomtyper store")
+        self.predicate_map = {}
+        for i in range(n_filters):
+            name_offset, name_length, k, size, m_bits, bits_offset = (
+                STORE_ENTRY.unpack_from(
+                    self.mm, STORE_HEADER.size + i * STORE_ENTRY.size
+                )
+            )
+            pred = self.mm[name_offset : name_offset + name_length].decode("utf8")
+            self.predicate_map[pred] = MappedBloom(
+                self.mm, k, size, m_bits, bits_offset
+            )
+
+    def __call__(self, value, predicate=None):
+        h1, h2 = bloom_hashes(value)
+        if predicate is None:
+            return [
+                pred
+                for pred, bloom in self.predicate_map.items()
+                if bloom.contains_hashes(h1, h2)
+            ]
+        bloom = self.predicate_map.get(predicate)
+        return bloom is not None and bloom.contains_hashes(h1, h2)
+
+    def __iter__(self):
+        for pred, bloom in self.predicate_map.items():
+            yield pred, bloom.size
+
+    def __getitem__(self, predicate):
+        return self.predicate_map.get(predicate, set())
+
+    def __contains__(self, predicate):
+        return predicate in self.predicate_map
+
+    def close(self):
+        self.predicate_map = {}
+        self.mm.close()
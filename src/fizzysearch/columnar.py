@@ -0,0 +1,204 @@
+import os, sys, json, mmap, struct, logging
+from array import array
+from .reader import read_nt, COLUMNAR_EXTENSION
+
+# A dictionary encoded triple file. Every distinct term (and every source file path)
+# gets an integer id, and the triples are stored as rows of four uint32 ids:
+# subject, predicate, object and the path of the file the triple came from.
+# Triples with a blank node subject are included, readers can skip them.
+#
+#   header | triples (n_triples * 4 uint32) | term bytes (padded to 8 bytes)
+#   | term offsets ((n_terms + 1) uint64) | sources (JSON list of [path, size, mtime_ns])
+#
+# The file is written once from the n-triple files, and later index builds memory-map it
+# instead of parsing the n-triples again. The sources section records the files it was
+# written from, so a stale columnar file can be detected with columnar_is_current().
+
+MAGIC = b"FIZZYFZT"
+VERSION = 3
+# magic, version, little_endian, n_terms, n_triples and the offsets of the four sections
+HEADER = struct.Struct("<8sIIQQQQQQ")
+WRITE_BATCH = 1 << 20
+
+
+class ColumnarFormatException(Exception):
+    pass
+
+
+def source_fingerprint(triplefile_paths: list):
+    """The absolute path, size and modification time of each file, sorted by path"""
+    fingerprint = []
+    for triplefile_path in triplefile_paths:
+        stat = os.stat(triplefile_path)
+        fingerprint.append(
+            [os.path.abspath(triplefile_path), stat.st_size, stat.st_mtime_ns]
+        )
+    return sorted(fingerprint)
+
+
+def build_columnar(triplefile_paths: list, columnar_path: str):
+    if not columnar_path.endswith(COLUMNAR_EXTENSION):
+        raise ColumnarFormatException(
+            f"The columnar triple file name has to end with {COLUMNAR_EXTENSION}"
+        )
+    sources = source_fingerprint(triplefile_paths)
+    tmp_path = columnar_path + ".tmp"
+    try:
+        count, n_terms = write_columnar(triplefile_paths, tmp_path, sources)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, columnar_path)
+    logging.debug(
+        f"Columnar triples {columnar_path} written, {count} triples and {n_terms} terms"
+    )
+    return count
+
+
+def write_columnar(triplefile_paths: list, path: str, sources: list):
+    terms = {}
+
+    def term_id(term):
+        tid = terms.get(term)
+        if tid is None:
+            tid = terms[term] = len(terms)
+        return tid
+
+    count = 0
+    with open(path, "wb") as F:
+        F.write(b"\0" * HEADER.size)
+        triples_offset = F.tell()
+        batch = array("I")
+        for s, p, o, triplefile_path in read_nt(triplefile_paths, blank_nodes=True):
+            batch.extend((term_id(s), term_id(p), term_id(o), term_id(triplefile_path)))
+            count += 1
+            if len(batch) >= WRITE_BATCH:
+                batch.tofile(F)
+                batch = array("I")
+        batch.tofile(F)
+
+        # The terms are encoded one at a time, the term dictionary can be large
+        terms_offset = F.tell()
+        offsets = array("Q", [0])
+        end = 0
+        for term in terms:
+            encoded = term.encode("utf8")
+            F.write(encoded)
+            end += len(encoded)
+            offsets.append(end)
+        F.write(b"\0" * (-F.tell() % 8))
+        offsets_offset = F.tell()
+        offsets.tofile(F)
+        sources_offset = F.tell()
+        F.write(json.dumps(sources).encode("utf8"))
+
+        F.seek(0)
+        F.write(
+            HEADER.pack(
+                MAGIC,
+                VERSION,
+                sys.byteorder == "little",
+                len(terms),
+                count,
+                triples_offset,
+                offsets_offset,
+                terms_offset,
+                sources_offset,
+            )
+        )
+    return count, len(terms)
+
+
+class ColumnarTriples:
+    def __init__(self, columnar_path: str):
+        self.path = columnar_path
+        with open(columnar_path, "rb") as F:
+            self.mm = mmap.mmap(F.fileno(), 0, access=mmap.ACCESS_READ)
+        (
+            magic,
+            version,
+            little_endian,
+            self.n_terms,
+            self.n_triples,
+            triples_offset,
+            offsets_offset,
+            terms_offset,
+            sources_offset,
+        ) = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self.mm.close()
+            raise ColumnarFormatException(
+                f"{columnar_path} is not a columnar triple file"
+            )
+        if bool(little_endian) != (sys.byteorder == "little"):
+            self.mm.close()
+            raise ColumnarFormatException(
+                f"{columnar_path} was written on a machine with a different byte order"
+            )
+        view = memoryview(self.mm)
+        self.triples = view[triples_offset:terms_offset].cast("I")
+        self.offsets = view[offsets_offset:sources_offset].cast("Q")
+        self.terms = view[terms_offset:offsets_offset]
+        self.sources = json.loads(str(view[sources_offset:], "utf8"))
+        self.view = view
+
+    def term(self, tid: int) -> str:
+        return str(self.terms[self.offsets[tid] : self.offsets[tid + 1]], "utf8")
+
+    def ids(self):
+        triples = self.triples
+        for i in range(0, len(triples), 4):
+            yield triples[i], triples[i + 1], triples[i + 2], triples[i + 3]
+
+    def __iter__(self):
+        return self.iter_triples()
+
+    def iter_triples(self, blank_nodes: bool = False):
+        # Predicates and file paths repeat a lot, so they are only decoded once
+        term = self.term
+        cache = {}
+        for s, p, o, f in self.ids():
+            ss = term(s)
+            if not blank_nodes and ss.startswith("_:"):
+                continue
+            pp = cache.get(p)
+            if pp is None:
+                pp = cache[p] = term(p)
+            ff = cache.get(f)
+            if ff is None:
+                ff = cache[f] = term(f)
+            yield ss, pp, term(o), ff
+
+    def __len__(self):
+        return self.n_triples
+
+    def close(self):
+        for view in (self.triples, self.offsets, self.terms, self.view):
+            view.release()
+        self.mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def columnar_is_current(columnar_path: str, triplefile_paths: list) -> bool:
+    """True if the columnar file exists and was written from exactly these files,
+    with the same sizes and modification times as they have now"""
+    if not os.path.exists(columnar_path):
+        return False
+    try:
+        with ColumnarTriples(columnar_path) as columnar:
+            sources = columnar.sources
+    except (ColumnarFormatException, struct.error, ValueError):
+        return False
+    return sources == source_fingerprint(triplefile_paths)
+
+
+def read_columnar(columnar_path: str, blank_nodes: bool = False):
+    with ColumnarTriples(columnar_path) as triples:
+        yield from triples.iter_triples(blank_nodes)
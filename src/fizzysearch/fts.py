@@ -1,7 +1,7 @@
-import os, sys, gzip, sqlite3, logging, argparse
+import os, sys, gzip, sqlite3, logging, argparse, threading
 from typing import Union
 from .reader import read_nt, literal_to_parts, decode_unicode_escapes
-
+from .metrics import METRICS
 
 DB_SCHEMA = """
 CREATE VIRTUAL TABLE IF NOT EXISTS literal_index USING fts5(subject UNINDEXED, predicate UNINDEXED, object, language UNINDEXED, datatype UNINDEXED );
@@ -31,15 +31,105 @@ class StringParamException(Exception):
     pass
 
 
+# The async searches share a bounded pool of threads, made on first use. asyncio and
+# concurrent.futures are slow to import, so only the async API loads them.
+FTS_ASYNC_THREADS = int(os.getenv("FIZZYSEARCH_FTS_ASYNC_THREADS", "8"))
+_FTS_EXECUTOR = None
+_FTS_EXECUTOR_LOCK = threading.Lock()
+
+
+def get_fts_executor():
+    global _FTS_EXECUTOR
+    if _FTS_EXECUTOR is None:
+        with _FTS_EXECUTOR_LOCK:
+            if _FTS_EXECUTOR is None:
+                from concurrent.futures import ThreadPoolExecutor
+
+                _FTS_EXECUTOR = ThreadPoolExecutor(
+                    max_workers=FTS_ASYNC_THREADS, thread_name_prefix="fizzysearch-fts"
+                )
+    return _FTS_EXECUTOR
+
+
+BLANK_NODE_SCHEMA = """
+PRAGMA journal_mode = OFF;
+PRAGMA synchronous = OFF;
+PRAGMA temp_store = FILE;
+CREATE TABLE bnode_refs (bnode TEXT, parent TEXT);
+CREATE TABLE bnode_literals (bnode TEXT, predicate TEXT, object TEXT, language TEXT, datatype TEXT);
+"""
+
+BLANK_NODE_OWNERS = """
+WITH RECURSIVE owners(bnode, owner, depth) AS (
+    SELECT DISTINCT l.bnode, r.parent, 1 FROM bnode_literals l JOIN bnode_refs r ON r.bnode = l.bnode
+    UNION
+    SELECT o.bnode, r.parent, o.depth + 1 FROM owners o JOIN bnode_refs r ON r.bnode = o.owner
+    WHERE o.depth < ? AND o.owner NOT LIKE '<%'
+)
+SELECT DISTINCT o.owner, l.predicate, l.object, l.language, l.datatype
+FROM bnode_literals l JOIN owners o ON o.bnode = l.bnode
+WHERE o.owner LIKE '<%'
+"""
+
+
+class BlankNodeLiterals:
+    """Collects the literals of blank nodes, and which subjects refer to which blank nodes,
+    in a temporary on-disk SQLite database, so that the memory use stays bounded by its
+    cache size (in KiB) instead of growing with the graph."""
+
+    def __init__(self, cache_size: int = 65536, max_depth: int = 10, batch_size=10000):
+        # An empty filename gives a private temporary database, deleted when closed
+        self.db = sqlite3.connect("")
+        self.db.execute(f"PRAGMA cache_size = -{int(cache_size)}")
+        self.db.executescript(BLANK_NODE_SCHEMA)
+        self.max_depth = max_depth
+        self.batch_size = batch_size
+        self.refs = []
+        self.literals = []
+
+    def add_ref(self, bnode: str, parent: str):
+        self.refs.append((bnode, parent))
+        if len(self.refs) >= self.batch_size:
+            self.flush()
+
+    def add_literal(
+        self, bnode: str, predicate: str, literal_value, language, datatype
+    ):
+        self.literals.append((bnode, predicate, literal_value, language, datatype))
+        if len(self.literals) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        self.db.executemany("INSERT INTO bnode_refs VALUES (?, ?)", self.refs)
+        self.db.executemany(
+            "INSERT INTO bnode_literals VALUES (?, ?, ?, ?, ?)", self.literals
+        )
+        self.refs = []
+        self.literals = []
+
+    def owned_literals(self):
+        """Yield (subject, predicate, object, language, datatype) for each blank node literal
+        and each IRI subject that refers to its blank node, directly or through other blank nodes
+        """
+        self.flush()
+        self.db.execute("CREATE INDEX bnode_refs_bnode ON bnode_refs (bnode)")
+        self.db.execute("CREATE INDEX bnode_literals_bnode ON bnode_literals (bnode)")
+        yield from self.db.execute(BLANK_NODE_OWNERS, (self.max_depth,))
+
+    def close(self):
+        self.db.close()
+
+
 def build_fts_index(
     triplefile_paths: list,
     index_db_path: Union[str, sqlite3.Connection],
     triple_iterator=None,
+    blank_nodes: bool = True,
 ):
 
     if len(triplefile_paths) > 0:
         logging.debug(f"Building FTS index with {triplefile_paths} in {index_db_path}")
-        iterator = read_nt(triplefile_paths)
+        iterator = read_nt(triplefile_paths, blank_nodes=blank_nodes)
     elif triple_iterator:
         logging.debug(
             f"Building FTS index with a specified iterator in {index_db_path}"
@@ -53,20 +143,54 @@ def build_fts_index(
 
     db = get_db(index_db_path)
 
-    count = 0
-    for s, p, o, _ in iterator:
-        # TODO - add support for blank nodes
-        # How? We will need to back-reference any blanknodes to their referred subjects... :-(
+    # Literals of blank nodes are indexed for the IRI subjects that refer to the blank node.
+    # Blank node labels are only unique within a file, so they are keyed on the file too.
+    bnodes = BlankNodeLiterals() if blank_nodes else None
 
-        literal_value, language, datatype = literal_to_parts(o)
+    count = triples = 0
+    with METRICS.timer("fts_build"):
+        for s, p, o, triplefile_path in iterator:
+            triples += 1
+            if s.startswith("_:"):
+                if bnodes is None:
+                    continue
+                s = f"{s} {triplefile_path}"
+                if o.startswith("_:"):
+                    bnodes.add_ref(f"{o} {triplefile_path}", s)
+                else:
+                    literal_value, language, datatype = literal_to_parts(o)
+                    if literal_value:
+                        bnodes.add_literal(s, p, literal_value, language, datatype)
+                continue
+            if o.startswith("_:"):
+                if bnodes is not None:
+                    bnodes.add_ref(f"{o} {triplefile_path}", s)
+                continue
 
-        if literal_value:
-            db.execute(
-                "INSERT INTO literal_index (subject, predicate, object, language, datatype) VALUES (?, ?, ?, ?, ?)",
-                (s, p, literal_value, language, datatype),
-            )
-            count += 1
-    db.commit()
+            literal_value, language, datatype = literal_to_parts(o)
+
+            if literal_value:
+                db.execute(
+                    "INSERT INTO literal_index (subject, predicate, object, language, datatype) VALUES (?, ?, ?, ?, ?)",
+                    (s, p, literal_value, language, datatype),
+                )
+                count += 1
+
+        if bnodes is not None:
+            bnode_count = 0
+            with METRICS.timer("fts_build_blank_nodes"):
+                for row in bnodes.owned_literals():
+                    db.execute(
+                        "INSERT INTO literal_index (subject, predicate, object, language, datatype) VALUES (?, ?, ?, ?, ?)",
+                        row,
+                    )
+                    bnode_count += 1
+            bnodes.close()
+            METRICS.incr("fts_build_blank_node_literals", bnode_count)
+            count += bnode_count
+        db.commit()
+    METRICS.incr("fts_build_triples", triples)
+    METRICS.incr("fts_build_literals", count)
     logging.debug(f"Building FTS index done, inserted {count} literals")
     return count
 
@@ -79,6 +203,30 @@ def use_fts(
     )
 
 
+def use_fts_async(
+    fts_filepath: Union[str, sqlite3.Connection],
+    use_language=False,
+    limit=999,
+    timeout: float = None,
+    batch_size: int = 100,
+):
+    """An async generator version of use_fts for rewrite_async, that yields the results in
+    batches, so that on a timeout the batches found so far are used, and the search still
+    running is interrupted. A connection passed as fts_filepath has to be made with
+    check_same_thread=False, as it is used from a thread, and should not be shared with
+    other searches, which the interrupt would stop too.
+    """
+
+    async def handler(varname, value):
+        async for chunk in search_fts_async(
+            fts_filepath, varname, value, use_language, limit, batch_size
+        ):
+            yield chunk
+
+    handler.timeout = timeout
+    return handler
+
+
 def use_fts_stats(
     fts_filepath: Union[str, sqlite3.Connection], use_language=False, limit=999
 ):
@@ -101,6 +249,96 @@ def search_fts(
     }
 
 
+def fts_select(q: str, language: str, use_language=False, limit=999):
+    if use_language:
+        theq = f"SELECT distinct subject, object, language, rank FROM literal_index WHERE object match ? and language = ? order by rank limit {limit}"
+        return theq, (q, language)
+    theq = f"SELECT distinct subject, object, language, rank FROM literal_index WHERE object match ? order by rank limit {limit}"
+    return theq, (q,)
+
+
+def fetch_fts(
+    db: sqlite3.Connection, literal: str, use_language=False, limit=999, batch_size=100
+):
+    """Yield the subjects that search_fts finds, in lists of at most batch_size"""
+    literal_value, language, datatype = literal_to_parts(literal)
+    if not literal_value:
+        return
+
+    METRICS.incr("fts_queries")
+    theq, params = fts_select(literal_value, language, use_language, limit)
+    try:
+        cursor = db.execute(theq, params)
+    except sqlite3.OperationalError as soe:
+        if str(soe).find("no such column") == -1:
+            raise
+        theq, params = fts_select(f'"{literal_value}"', language, use_language, limit)
+        cursor = db.execute(theq, params)
+    while True:
+        with METRICS.timer("fts_query"):
+            rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        METRICS.incr("fts_results", len(rows))
+        yield [(subject,) for subject, _, _, _ in rows]
+
+
+async def search_fts_async(
+    fts_index: Union[str, sqlite3.Connection],
+    varname: str,
+    literal: str,
+    use_language=False,
+    limit=999,
+    batch_size: int = 100,
+):
+    # The batches of one search are fetched one after the other, on any of the shared
+    # threads, so its connection is never used by two threads at once. When the consumer
+    # stops early, on a timeout say, a statement that is still running is interrupted.
+    import asyncio
+
+    executor = get_fts_executor()
+    state = {"cancelled": False}
+
+    def first_batch():
+        if isinstance(fts_index, str):
+            db = state["connection"] = sqlite3.connect(
+                fts_index, check_same_thread=False
+            )
+        else:
+            db = fts_index
+        with METRICS.timer("fts_index_load"):
+            state["db"] = get_db(db)
+        if state["cancelled"]:
+            return None
+        state["batches"] = fetch_fts(
+            state["db"], literal, use_language, limit, batch_size
+        )
+        return next(state["batches"], None)
+
+    def cleanup(_=None):
+        if "batches" in state:
+            state["batches"].close()
+        if "connection" in state:
+            state["connection"].close()
+
+    pending = executor.submit(first_batch)
+    try:
+        while True:
+            batch = await asyncio.wrap_future(pending)
+            if batch is None:
+                return
+            yield {"results": batch, "vars": (varname,)}
+            pending = executor.submit(next, state["batches"], None)
+    finally:
+        state["cancelled"] = True
+        if pending.done():
+            cleanup()
+        else:
+            if "db" in state:
+                state["db"].interrupt()
+            pending.add_done_callback(cleanup)
+
+
 def search_fts_stats(
     fts_index: Union[str, sqlite3.Connection],
     varname: str,
@@ -108,31 +346,29 @@ def search_fts_stats(
     use_language=False,
     limit=999,
 ):
-    db = get_db(fts_index)
+    with METRICS.timer("fts_index_load"):
+        db = get_db(fts_index)
     literal_value, language, datatype = literal_to_parts(literal)
     if not literal_value:
         return {}
 
     def doit(q, language):
-        if use_language:
-            theq = f"SELECT distinct subject, object, language, rank FROM literal_index WHERE object match ? and language = ? order by rank limit {limit}"
-            params = (q, language)
-        else:
-            theq = f"SELECT distinct subject, object, language, rank FROM literal_index WHERE object match ? order by rank limit {limit}"
-
-            params = (q,)
+        theq, params = fts_select(q, language, use_language, limit)
 
         back = []
-        for subject, object, o_language, rank in db.execute(theq, params):
-            object = decode_unicode_escapes(object)
-            if len(object) > 999:
-                object = object[:999] + "..."
-            if o_language:
-                back.append(
-                    (subject, f'"{object}"@{o_language}', f'"{rank}"^^xsd:decimal')
-                )
-            else:
-                back.append((subject, f'"{object}"', f'"{rank}"^^xsd:decimal'))
+        METRICS.incr("fts_queries")
+        with METRICS.timer("fts_query"):
+            for subject, object, o_language, rank in db.execute(theq, params):
+                object = decode_unicode_escapes(object)
+                if len(object) > 999:
+                    object = object[:999] + "..."
+                if o_language:
+                    back.append(
+                        (subject, f'"{object}"@{o_language}', f'"{rank}"^^xsd:decimal')
+                    )
+                else:
+                    back.append((subject, f'"{object}"', f'"{rank}"^^xsd:decimal'))
+        METRICS.incr("fts_results", len(back))
         return back
 
     try:
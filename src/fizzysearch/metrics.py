@@ -0,0 +1,147 @@
+import os, time, threading
+
+# Opt-in timers and counters for the hot paths. When disabled (the default), timer()
+# hands out a shared no-op context manager and incr() returns straight away.
+
+
+class Timer:
+    def __init__(self, metrics, name: str, labels: tuple = ()):
+        self.metrics = metrics
+        self.key = (name, labels)
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+        self.metrics.observe(self.key, self.elapsed)
+        return False
+
+
+class NullTimer:
+    elapsed = 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+
+class Metrics:
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.timers = {}  # (name, labels) -> [count, sum, max]
+            self.counters = {}  # (name, labels) -> value
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def timer(self, name: str, labels: dict = None):
+        if not self.enabled:
+            return NULL_TIMER
+        return Timer(self, name, tuple(sorted(labels.items())) if labels else ())
+
+    def observe(self, key: tuple, seconds: float):
+        with self.lock:
+            timing = self.timers.get(key)
+            if timing is None:
+                self.timers[key] = [1, seconds, seconds]
+            else:
+                timing[0] += 1
+                timing[1] += seconds
+                if seconds > timing[2]:
+                    timing[2] = seconds
+
+    def incr(self, name: str, value: int = 1, labels: dict = None):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())) if labels else ())
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def snapshot(self):
+        with self.lock:
+            timers = {
+                _flat_name(name, labels): {"count": count, "sum": total, "max": tmax}
+                for (name, labels), (count, total, tmax) in self.timers.items()
+            }
+            counters = {
+                _flat_name(name, labels): value
+                for (name, labels), value in self.counters.items()
+            }
+        return {"timers": timers, "counters": counters}
+
+    def to_prometheus(self, prefix: str = "fizzysearch"):
+        with self.lock:
+            timers = sorted(self.timers.items())
+            counters = sorted(self.counters.items())
+
+        lines = []
+        typed = set()
+        for (name, labels), (count, total, _) in timers:
+            metric = f"{prefix}_{name}_seconds"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} summary")
+                typed.add(metric)
+            lines.append(f"{metric}_count{_prometheus_labels(labels)} {count}")
+            lines.append(f"{metric}_sum{_prometheus_labels(labels)} {total}")
+        for (name, labels), value in counters:
+            metric = f"{prefix}_{name}_total"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            lines.append(f"{metric}{_prometheus_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _flat_name(name: str, labels: tuple):
+    if not labels:
+        return name
+    return name + "{" + ",".join(f"{k}={v}" for k, v in labels) + "}"
+
+
+def _prometheus_labels(labels: tuple):
+    if not labels:
+        return ""
+    escaped = [
+        (k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in labels
+    ]
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+METRICS = Metrics(os.getenv("FIZZYSEARCH_METRICS", "").lower() in ("1", "true", "yes"))
+
+
+def enable():
+    METRICS.enable()
+
+
+def disable():
+    METRICS.disable()
+
+
+def reset():
+    METRICS.reset()
+
+
+def snapshot():
+    return METRICS.snapshot()
+
+
+def to_prometheus(prefix: str = "fizzysearch"):
+    return METRICS.to_prometheus(prefix)
@@ -1,7 +1,6 @@
 import logging, sqlite3, gzip
-import voyager
-import numpy as np
 from .reader import read_nt
+from .metrics import METRICS
 
 
 class StringParamException(Exception):
@@ -30,7 +29,8 @@ def build_rdf2vec_index(
     # The imports are inside the building method so we can exclude these libraries at runtime
     # if we only want to use the index not build it.
     import multiprocessing
-    
+
+    import voyager
     import igraph as ig
     import gensim
     import xxhash
@@ -39,20 +39,23 @@ def build_rdf2vec_index(
     nodes = {}
     as_ints = []
     only_subjects = set()
-    for s, p, o, _ in iterator:
-        s = s.strip("<>")
-        p = p.strip("<>")
-        o = o.strip("<>")  # and literals just remain as they are
-        ss = xxhash.xxh64(s).intdigest()
-        pp = xxhash.xxh64(p).intdigest()
-        oo = xxhash.xxh64(o).intdigest()
-        nodes[ss] = s
-        nodes[oo] = o
-        nodes[pp] = p
-        # we are also just sticking the predicates in as nodes, but they are not used for walks
-
-        as_ints.append((ss, pp, oo))
-        only_subjects.add(ss)
+    triples = 0
+    with METRICS.timer("rdf2vec_build_read"):
+        for s, p, o, _ in iterator:
+            triples += 1
+            s = s.strip("<>")
+            p = p.strip("<>")
+            o = o.strip("<>")  # and literals just remain as they are
+            ss = xxhash.xxh64(s).intdigest()
+            pp = xxhash.xxh64(p).intdigest()
+            oo = xxhash.xxh64(o).intdigest()
+            nodes[ss] = s
+            nodes[oo] = o
+            nodes[pp] = p
+            # we are also just sticking the predicates in as nodes, but they are not used for walks
+
+            as_ints.append((ss, pp, oo))
+            only_subjects.add(ss)
 
     # Make as_ints unique
     as_ints = list(sorted(set(as_ints)))
@@ -67,24 +70,26 @@ def build_rdf2vec_index(
     graph.es["p_i"] = [nodemap[p] for s, p, o in as_ints]
 
     logging.debug("RDF2Vec init: doing random walks")
-    data = set(
-        tuple(
-            [
-                tuple(graph.random_walk(nodemap[s], 15))
-                for s in only_subjects
-                for x in range(100)
-            ]
+    with METRICS.timer("rdf2vec_build_walks"):
+        data = set(
+            tuple(
+                [
+                    tuple(graph.random_walk(nodemap[s], 15))
+                    for s in only_subjects
+                    for x in range(100)
+                ]
+            )
         )
-    )
 
     logging.debug("RDF2Vec init: now training model")
-    model = gensim.models.Word2Vec(
-        sentences=data,
-        vector_size=100,
-        window=5,
-        min_count=1,
-        workers=multiprocessing.cpu_count(),
-    )
+    with METRICS.timer("rdf2vec_build_train"):
+        model = gensim.models.Word2Vec(
+            sentences=data,
+            vector_size=100,
+            window=5,
+            min_count=1,
+            workers=multiprocessing.cpu_count(),
+        )
     vectors = []
     for node_id in only_subjects:
         thevector = model.wv.get_vector(nodemap[node_id])
@@ -108,6 +113,7 @@ CREATE INDEX IF NOT EXISTS rdf2vec_index_uri ON rdf2vec_index (uri);
 
     DB.executemany("INSERT INTO rdf2vec_index VALUES (?, ?, ?)", to_insert)
     DB.commit()
+    METRICS.incr("rdf2vec_build_triples", triples)
     logging.debug(f"RDF2Vec mapping saved in {rdf2vec_index_path}.db")
     return len(to_insert)
 
@@ -116,32 +122,55 @@ def use_rdf2vec(rdf2vec_index: str, limit: int = 20):
     return lambda varname, value: search_rdf2vec(rdf2vec_index, varname, value, limit)
 
 
+def use_rdf2vec_async(rdf2vec_index: str, limit: int = 20, timeout: float = None):
+    """use_rdf2vec for rewrite_async, the search runs in a thread"""
+
+    async def handler(varname, value):
+        import asyncio
+
+        return await asyncio.to_thread(
+            search_rdf2vec, rdf2vec_index, varname, value, limit
+        )
+
+    handler.timeout = timeout
+    return handler
+
+
 def search_rdf2vec(rdf2vec_index: str, varname: str, node_uri: str, limit: int = 20):
     if not rdf2vec_index or not node_uri:
         return {}
 
+    # Imported here so that importing fizzysearch stays fast when rdf2vec is not used
+    import voyager
+    import numpy as np
+
     node_uri = node_uri.strip("<>")
 
+    METRICS.incr("rdf2vec_queries")
     DB = sqlite3.connect(rdf2vec_index + ".db")
     found = False
-    for row in DB.execute(
-        "SELECT vector FROM rdf2vec_index WHERE uri = ?", (node_uri,)
-    ):
-        vector = np.frombuffer(row[0], dtype=np.float32)
-        found = True
+    with METRICS.timer("rdf2vec_sql"):
+        for row in DB.execute(
+            "SELECT vector FROM rdf2vec_index WHERE uri = ?", (node_uri,)
+        ):
+            vector = np.frombuffer(row[0], dtype=np.float32)
+            found = True
     if not found:
         return {}
 
-    index = voyager.Index.load(rdf2vec_index)
-    ids, distances = index.query(vector, limit)
+    with METRICS.timer("rdf2vec_index_load"):
+        index = voyager.Index.load(rdf2vec_index)
+    with METRICS.timer("rdf2vec_query"):
+        ids, distances = index.query(vector, limit)
     result_dict = {}
     for id, distance in zip(ids, distances):
         result_dict[id] = {"distance": distance}
     ids_as = ",".join(str(anid) for anid in ids)
-    for id, uri in DB.execute(
-        f"SELECT id, uri FROM rdf2vec_index WHERE id IN ({ids_as})"
-    ):
-        result_dict[id]["uri"] = uri
+    with METRICS.timer("rdf2vec_sql"):
+        for id, uri in DB.execute(
+            f"SELECT id, uri FROM rdf2vec_index WHERE id IN ({ids_as})"
+        ):
+            result_dict[id]["uri"] = uri
     sorted_results = sorted(
         [(val["distance"], val["uri"]) for val in result_dict.values()]
     )
@@ -149,5 +178,6 @@ def search_rdf2vec(rdf2vec_index: str, varname: str, node_uri: str, limit: int =
     results = [
         (f"<{uri}>", f'"{distance}"^^xsd:decimal') for distance, uri in sorted_results
     ]
+    METRICS.incr("rdf2vec_results", len(results))
     logging.debug(f"RDF2Vec search for {node_uri} found {len(results)}")
     return {"results": results, "vars": (varname, varname + "Score")}
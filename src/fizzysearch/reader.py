@@ -1,4 +1,16 @@
-import gzip, re
+import os, gzip, io, re
+from contextlib import contextmanager
+
+COLUMNAR_EXTENSION = ".fzt"
+
+# External decompressors that are used when installed. They run in their own process,
+# so decompression overlaps with parsing, and pigz, lbzip2 and pbzip2 use several cores.
+# Set FIZZYSEARCH_EXTERNAL_DECOMPRESSORS=0 to always use the Python modules.
+EXTERNAL_DECOMPRESSORS = {
+    ".gz": (("pigz", "-dc"),),
+    ".bz2": (("lbzip2", "-dc"), ("pbzip2", "-dc")),
+    ".zst": (("zstd", "-dcq"),),
+}
 
 
 def literal_to_parts(literal: str):
@@ -49,32 +61,110 @@ class StringParamException(Exception):
     pass
 
 
-def read_nt(triplefile_paths: list):
+def use_external_decompressors():
+    return os.getenv("FIZZYSEARCH_EXTERNAL_DECOMPRESSORS", "1").lower() not in (
+        "0",
+        "false",
+        "no",
+    )
+
+
+def open_zstd(triplefile_path: str):
+    try:
+        from compression import zstd  # Python 3.14 and later
+
+        return zstd.open(triplefile_path, "rb")
+    except ImportError:
+        pass
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError(
+            f"Reading {triplefile_path} needs the zstd command line tool or the zstandard package"
+        )
+    return io.BufferedReader(
+        zstandard.ZstdDecompressor().stream_reader(
+            open(triplefile_path, "rb"), closefd=True
+        )
+    )
+
+
+@contextmanager
+def open_triplefile(triplefile_path: str):
+    """Open a (possibly compressed) n-triple file for reading in binary mode"""
+    extension = os.path.splitext(triplefile_path)[1]
+    if extension in EXTERNAL_DECOMPRESSORS and use_external_decompressors():
+        # Imported here, as reader is loaded by the search side too, which never needs them
+        import shutil, subprocess
+
+        for command in EXTERNAL_DECOMPRESSORS[extension]:
+            if shutil.which(command[0]):
+                process = subprocess.Popen(
+                    command + (triplefile_path,), stdout=subprocess.PIPE
+                )
+                try:
+                    yield process.stdout
+                except BaseException:
+                    # the reader stopped early
+                    process.stdout.close()
+                    process.terminate()
+                    process.wait()
+                    raise
+                process.stdout.close()
+                if process.wait() != 0:
+                    raise OSError(
+                        f"{command[0]} exited with {process.returncode} reading {triplefile_path}"
+                    )
+                return
+
+    if extension == ".gz":
+        thefile = gzip.open(triplefile_path, "rb")
+    elif extension == ".bz2":
+        import bz2
+
+        thefile = bz2.open(triplefile_path, "rb")
+    elif extension == ".zst":
+        thefile = open_zstd(triplefile_path)
+    else:
+        thefile = open(triplefile_path, "rb")
+    try:
+        yield thefile
+    finally:
+        thefile.close()
+
+
+def read_nt(triplefile_paths: list, blank_nodes: bool = False):
+    """Yield the (subject, predicate, object, triplefile_path) of the triples in the files.
+    Triples with a blank node subject are skipped, unless blank_nodes is True."""
     if not type(triplefile_paths) == list:
         raise StringParamException(
             "triplefile_paths must be a list of paths to n-triple files"
         )
 
     for triplefile_path in triplefile_paths:
-        if triplefile_path.endswith(".gz"):
-            thefile = gzip.open(triplefile_path, "rb")
-        else:
-            thefile = open(triplefile_path, "rb")
-        for line in thefile:
-            if not line.endswith(b" .\n"):
-                continue
-            line = decode_unicode_escapes(line.decode("utf8"))
-            line = line.strip()
-            line = line[:-2]
-            parts = line.split(" ")
-            if len(parts) > 2:
-                s = parts[0]
-                p = parts[1]
-                o = " ".join(parts[2:])
-
-            if not (s.startswith("<") and s.endswith(">")):
-                continue
-            if not (p.startswith("<") and p.endswith(">")):
-                continue
-
-            yield s, p, o, triplefile_path
+        if triplefile_path.endswith(COLUMNAR_EXTENSION):
+            from .columnar import read_columnar
+
+            yield from read_columnar(triplefile_path, blank_nodes)
+            continue
+
+        with open_triplefile(triplefile_path) as thefile:
+            for line in thefile:
+                if not line.endswith(b" .\n"):
+                    continue
+                line = decode_unicode_escapes(line.decode("utf8"))
+                line = line.strip()
+                line = line[:-2]
+                parts = line.split(" ")
+                if len(parts) > 2:
+                    s = parts[0]
+                    p = parts[1]
+                    o = " ".join(parts[2:])
+
+                if not (s.startswith("<") and s.endswith(">")):
+                    if not (blank_nodes and s.startswith("_:")):
+                        continue
+                if not (p.startswith("<") and p.endswith(">")):
+                    continue
+
+                yield s, p, o, triplefile_path
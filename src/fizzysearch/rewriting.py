@@ -1,33 +1,195 @@
-import os, sys, argparse
-from tree_sitter import Language, Parser
+import os, sys, argparse, logging, threading, functools
+from .metrics import METRICS
 
-if sys.platform == "darwin":
-    SPARQL = Language("/usr/local/lib/sparql.dylib", "sparql")
-else:
-    SPARQL = Language("/usr/local/lib/sparql.so", "sparql")
+TRIPLES_QUERY = """((triples_same_subject (var) @var (property_list (property (path_element [(iri_reference) @predicate (prefixed_name) @predicate_prefix]) (object_list [(rdf_literal) @q_object_literal (iri_reference) @q_object_iri])))) @tss (".")* @tss_dot )"""
+QUERY_TYPES = ("select", "construct", "ask", "describe")
 
-PARSER = Parser()
-PARSER.set_language(SPARQL)
+# The SPARQL grammar, parser and compiled queries are set up on first use, not at import
+_SPARQL = _PARSER = _QUERIES = None
+_SPARQL_LOCK = threading.Lock()
+
+
+def get_sparql():
+    global _SPARQL, _PARSER, _QUERIES
+    if _SPARQL is None:
+        with _SPARQL_LOCK:
+            if _SPARQL is None:
+                # tree_sitter itself is slow to import, it pulls in distutils
+                from tree_sitter import Language, Parser
+
+                if sys.platform == "darwin":
+                    sparql = Language("/usr/local/lib/sparql.dylib", "sparql")
+                else:
+                    sparql = Language("/usr/local/lib/sparql.so", "sparql")
+                parser = Parser()
+                parser.set_language(sparql)
+                queries = {t: sparql.query(f"({t}_query) @{t}_q") for t in QUERY_TYPES}
+                queries["comment"] = sparql.query("(comment) @comment")
+                queries["triples"] = sparql.query(TRIPLES_QUERY)
+                _PARSER, _QUERIES = parser, queries
+                _SPARQL = sparql
+    return _SPARQL, _PARSER, _QUERIES
+
+
+def __getattr__(name: str):
+    # SPARQL and PARSER used to be module level globals
+    if name == "SPARQL":
+        return get_sparql()[0]
+    if name == "PARSER":
+        return get_sparql()[1]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def rewrite(query: str, predicate_map: dict = dict()) -> dict:
     """@var predicate_map is a dictionary keyed on properties that map to a callable that can be called to expand values for that property"""
 
+    result, found_vars = parse_query(query, predicate_map)
+
+    outputs = []
+    for start_byte, end_byte, var_name, q_object, predicate in found_vars:
+        tocall = predicate_map.get(predicate)
+        if not tocall:
+            outputs.append(None)
+            continue
+        with METRICS.timer(
+            "rewrite_handler", {"predicate": predicate}
+        ) as handler_timer:
+            output = tocall(var_name, q_object)
+        outputs.append(output)
+        record_handler(result, predicate, var_name, handler_timer.elapsed, output)
+
+    splice(query, result, found_vars, outputs)
+    return result
+
+
+async def rewrite_async(
+    query: str, predicate_map: dict = dict(), timeout: float = None
+) -> dict:
+    """Like rewrite, but the predicate_map callables are run concurrently, and may be
+    coroutine functions or async generators (yielding partial outputs) as well as plain
+    callables, which are run in a thread.
+
+    Each callable gets a deadline in seconds, from its timeout attribute (see with_timeout)
+    or else the timeout parameter. A callable that misses its deadline or raises an
+    exception contributes the results it yielded so far, or none, and is listed in
+    result["truncated"] with the reason. So is a callable that returns no output, or an
+    output without "vars", like {} for a value that is not in an index."""
+
+    # asyncio is slow to import, so it is only loaded by the async API
+    import asyncio
+
+    result, found_vars = parse_query(query, predicate_map)
+    result["truncated"] = []
+
+    async def call(var_name, q_object, predicate):
+        tocall = predicate_map.get(predicate)
+        if not tocall:
+            return None
+        deadline = getattr(tocall, "timeout", None) or timeout
+        with METRICS.timer(
+            "rewrite_handler", {"predicate": predicate}
+        ) as handler_timer:
+            output, reason = await call_handler(tocall, var_name, q_object, deadline)
+        if not isinstance(output, dict) or not output.get("vars"):
+            output = {"results": [], "vars": (var_name,)}
+            reason = reason or "empty"
+        if reason:
+            if reason == "timeout":
+                METRICS.incr("rewrite_handler_timeouts", 1, {"predicate": predicate})
+            elif reason == "error":
+                METRICS.incr("rewrite_handler_errors", 1, {"predicate": predicate})
+            result["truncated"].append(
+                {
+                    "predicate": predicate,
+                    "var": var_name,
+                    "timeout": deadline,
+                    "results": len(output.get("results", [])),
+                    "reason": reason,
+                }
+            )
+        record_handler(result, predicate, var_name, handler_timer.elapsed, output)
+        return output
+
+    outputs = await asyncio.gather(
+        *[
+            call(var_name, q_object, predicate)
+            for _, _, var_name, q_object, predicate in found_vars
+        ]
+    )
+
+    splice(query, result, found_vars, outputs)
+    return result
+
+
+async def call_handler(handler, varname: str, value: str, timeout: float = None):
+    """Call a predicate_map callable, returning its output and None, or the partial output
+    and the reason it was cut short, which is either "timeout" or "error".
+
+    An exception raised by the callable is logged, not propagated, so that one failing
+    search does not fail the whole rewrite."""
+    import asyncio, inspect
+
+    partial = {"results": [], "vars": (varname,)}
+
+    async def run():
+        if inspect.isasyncgenfunction(handler) or inspect.iscoroutinefunction(handler):
+            outcome = handler(varname, value)
+        else:
+            outcome = await asyncio.to_thread(handler, varname, value)
+        if inspect.isasyncgen(outcome):
+            try:
+                async for chunk in outcome:
+                    partial["results"].extend(chunk.get("results", []))
+                    partial["vars"] = chunk.get("vars", partial["vars"])
+            finally:
+                await outcome.aclose()
+            return partial
+        if inspect.isawaitable(outcome):
+            return await outcome
+        return outcome
+
+    try:
+        return await asyncio.wait_for(run(), timeout), None
+    except asyncio.TimeoutError:
+        return partial, "timeout"
+    except Exception:
+        logging.exception(f"Error in handler for {varname} {value}")
+        return partial, "error"
+
+
+def with_timeout(handler, timeout: float):
+    """Give a predicate_map callable its own deadline for rewrite_async"""
+    wrapped = functools.partial(handler)
+    wrapped.timeout = timeout
+    return wrapped
+
+
+def parse_query(query: str, predicate_map: dict):
+    """Parse the query, returning the start of the rewrite result and the triple patterns
+    (start_byte, end_byte, var_name, q_object, predicate) that use a predicate in predicate_map
+    """
+
     result = {"query": query, "rewritten": query, "comments": []}
-    tree = PARSER.parse(query.encode("utf8"))
+    METRICS.incr("rewrite_queries")
+    _, parser, queries = get_sparql()
+    with METRICS.timer("rewrite_parse") as parse_timer:
+        tree = parser.parse(query.encode("utf8"))
+    if METRICS.enabled:
+        result["stats"] = {
+            "parse_seconds": parse_timer.elapsed,
+            "handlers": [],
+            "splice_seconds": 0.0,
+        }
 
     result["query_type"] = None
-    for t in ("select", "construct", "ask", "describe"):
-        for m, m_name in SPARQL.query(f"({t}_query) @{t}_q").captures(tree.root_node):
+    for t in QUERY_TYPES:
+        for m, m_name in queries[t].captures(tree.root_node):
             result["query_type"] = t
 
-    comment_q = SPARQL.query("(comment) @comment")
-    for n, name in comment_q.captures(tree.root_node):
+    for n, name in queries["comment"].captures(tree.root_node):
         result["comments"].append(n.text.decode("utf8").strip("# "))
 
-    q = SPARQL.query(
-        """((triples_same_subject (var) @var (property_list (property (path_element [(iri_reference) @predicate (prefixed_name) @predicate_prefix]) (object_list [(rdf_literal) @q_object_literal (iri_reference) @q_object_iri])))) @tss (".")* @tss_dot )"""
-    )
+    q = queries["triples"]
     found_vars = []
     found = False
     start_byte = end_byte = 0
@@ -61,51 +223,74 @@ def rewrite(query: str, predicate_map: dict = dict()) -> dict:
         if var_name is not None and q_object is not None and found:
             found_vars.append((start_byte, end_byte, var_name, q_object, predicate))
 
-    if len(found_vars) > 0:
+    return result, found_vars
+
+
+def record_handler(result: dict, predicate: str, var_name: str, seconds: float, output):
+    if not METRICS.enabled:
+        return
+    METRICS.incr(
+        "rewrite_handler_results",
+        len(output.get("results", [])),
+        {"predicate": predicate},
+    )
+    result["stats"]["handlers"].append(
+        {
+            "predicate": predicate,
+            "var": var_name,
+            "seconds": seconds,
+            "results": len(output.get("results", [])),
+        }
+    )
+
+
+def splice(query: str, result: dict, found_vars: list, outputs: list):
+    """Replace the found triple patterns in the query by VALUES clauses made from the outputs"""
+    if len(found_vars) == 0:
+        return
+
+    with METRICS.timer("rewrite_splice") as splice_timer:
+        values = [
+            format_values(output) if output is not None else None for output in outputs
+        ]
         newq = []
         query_bytes = query.encode("utf8")
         i = 0
         while i < len(query_bytes):
             c = query_bytes[i]
             in_found = False
-            for start_byte, end_byte, var_name, q_object, predicate in found_vars:
+            for found_index, (start_byte, end_byte, _, _, _) in enumerate(found_vars):
                 if i >= start_byte and i <= end_byte:
                     in_found = True
-                    tocall = predicate_map.get(predicate)
-                    if tocall:
-                        output = tocall(var_name, q_object)
-                        results = []
-                        for line in output.get("results", []):
-                            lline = " ".join(
-                                [l for l in line if not l.startswith("_:")]
-                            )
-                            if len(line) > 1:
-                                results.append(f"({lline})")
-                            else:
-                                results.append(lline)
-                        vars = output.get("vars", [])
-                        if len(vars) > 1:
-                            results = (
-                                "VALUES ("
-                                + " ".join([var for var in vars])
-                                + ")\n{"
-                                + "\n".join(results)
-                                + "\n}"
-                            )
-                        else:
-                            results = (
-                                f"VALUES {vars[0]}"
-                                + " {\n"
-                                + "\n".join(results)
-                                + "\n}"
-                            )
-                        for cc in results:
+                    if values[found_index] is not None:
+                        for cc in values[found_index]:
                             newq.append(cc)
                         i = end_byte
             if not in_found:
                 newq.append(chr(c))
             i += 1
         newq = "".join(newq)
-        result["rewritten"] = newq
+    result["rewritten"] = newq
+    if METRICS.enabled:
+        result["stats"]["splice_seconds"] = splice_timer.elapsed
 
-    return result
+
+def format_values(output: dict) -> str:
+    """Turn the output of a predicate_map callable into a SPARQL VALUES clause"""
+    results = []
+    for line in output.get("results", []):
+        lline = " ".join([l for l in line if not l.startswith("_:")])
+        if len(line) > 1:
+            results.append(f"({lline})")
+        else:
+            results.append(lline)
+    vars = output.get("vars", [])
+    if len(vars) > 1:
+        return (
+            "VALUES ("
+            + " ".join([var for var in vars])
+            + ")\n{"
+            + "\n".join(results)
+            + "\n}"
+        )
+    return f"VALUES {vars[0]}" + " {\n" + "\n".join(results) + "\n}"
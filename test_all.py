@@ -1,6 +1,6 @@
 import fizzysearch
 from fizzysearch import use_fts
-import sqlite3
+import sqlite3, subprocess, sys, asyncio, time
 import pytest
 
 
@@ -112,5 +112,170 @@ def test_passing_string_to_fts_index(testdb):
         fizzysearch.fts.build_fts_index("astring", testdb)
 
 
+BLANK_NODE_TRIPLES = """<http://example.org/pizza> <http://example.org/label> _:label1 .
+_:label1 <http://example.org/value> "Margherita"@it .
+_:label1 <http://example.org/more> _:label2 .
+_:label2 <http://example.org/value> "Mozzarella"@it .
+_:orphan <http://example.org/value> "Orphan" .
+"""
+
+
+def test_blank_node_literals():
+    bnodes = fizzysearch.fts.BlankNodeLiterals()
+    bnodes.add_ref("_:label1 f", "<http://example.org/pizza>")
+    bnodes.add_ref("_:label2 f", "_:label1 f")
+    bnodes.add_literal(
+        "_:label2 f", "<http://example.org/value>", "Mozzarella", "it", None
+    )
+    bnodes.add_literal("_:orphan f", "<http://example.org/value>", "Orphan", None, None)
+    owned = list(bnodes.owned_literals())
+    bnodes.close()
+    assert owned == [
+        (
+            "<http://example.org/pizza>",
+            "<http://example.org/value>",
+            "Mozzarella",
+            "it",
+            None,
+        )
+    ]
+
+
+def test_fts_blank_nodes(tmp_path):
+    path = tmp_path / "bnodes.nt"
+    path.write_text(BLANK_NODE_TRIPLES)
+    db = sqlite3.connect(":memory:")
+    assert fizzysearch.fts.build_fts_index([str(path)], db) == 2
+    results = fizzysearch.fts.search_fts(db, "?s", '"Mozzarella"')
+    assert results["results"] == [("<http://example.org/pizza>",)]
+    db.close()
+
+
+def test_rewrite_async_fts(tmp_path):
+    path = str(tmp_path / "pizza.db")
+    fizzysearch.fts.build_fts_index(["pizza.nt"], path)
+    query = 'SELECT ?var WHERE { ?var <https://fizzysearch.ise.fiz-karlsruhe.de/fts> "PizzaComQueijo" . }'
+    expected_query = "SELECT ?var WHERE { VALUES ?var {\n<http://www.co-ode.org/ontologies/pizza/pizza.owl#CheeseyPizza>\n}}"
+    result = asyncio.run(
+        fizzysearch.rewrite_async(
+            query,
+            {
+                "https://fizzysearch.ise.fiz-karlsruhe.de/fts": fizzysearch.use_fts_async(
+                    path
+                )
+            },
+        )
+    )
+    assert result["rewritten"] == expected_query
+    assert result["truncated"] == []
+
+
+def test_rewrite_async_timeouts():
+    async def partial_handler(varname, value):
+        yield {"results": [("<http://example.org/a>",)], "vars": (varname,)}
+        await asyncio.sleep(10)
+        yield {"results": [("<http://example.org/b>",)], "vars": (varname,)}
+
+    def slow_handler(varname, value):
+        time.sleep(0.2)
+        return {"results": [("<http://example.org/c>",)], "vars": (varname,)}
+
+    query = 'SELECT * WHERE { ?a <http://example.org/p1> "a" . ?b <http://example.org/p2> "b" . }'
+    result = asyncio.run(
+        fizzysearch.rewrite_async(
+            query,
+            {
+                "http://example.org/p1": partial_handler,
+                "http://example.org/p2": fizzysearch.with_timeout(slow_handler, 5),
+            },
+            timeout=0.05,
+        )
+    )
+    assert (
+        result["rewritten"]
+        == "SELECT * WHERE { VALUES ?a {\n<http://example.org/a>\n}VALUES ?b {\n<http://example.org/c>\n}}"
+    )
+    assert result["truncated"] == [
+        {
+            "predicate": "http://example.org/p1",
+            "var": "?a",
+            "timeout": 0.05,
+            "results": 1,
+            "reason": "timeout",
+        }
+    ]
+
+
+def test_rewrite_async_errors():
+    async def failing_handler(varname, value):
+        yield {"results": [("<http://example.org/a>",)], "vars": (varname,)}
+        raise sqlite3.OperationalError('fts5: syntax error near ""')
+
+    def working_handler(varname, value):
+        return {"results": [("<http://example.org/c>",)], "vars": (varname,)}
+
+    query = 'SELECT * WHERE { ?a <http://example.org/p1> "pizza AND" . ?b <http://example.org/p2> "b" . }'
+    result = asyncio.run(
+        fizzysearch.rewrite_async(
+            query,
+            {
+                "http://example.org/p1": failing_handler,
+                "http://example.org/p2": working_handler,
+            },
+        )
+    )
+    assert (
+        result["rewritten"]
+        == "SELECT * WHERE { VALUES ?a {\n<http://example.org/a>\n}VALUES ?b {\n<http://example.org/c>\n}}"
+    )
+    assert result["truncated"] == [
+        {
+            "predicate": "http://example.org/p1",
+            "var": "?a",
+            "timeout": None,
+            "results": 1,
+            "reason": "error",
+        }
+    ]
+
+
+def test_rewrite_async_empty_outputs():
+    # like use_rdf2vec_async for an IRI that is not in the index
+    async def not_indexed(varname, value):
+        return {}
+
+    def nothing(varname, value):
+        return None
+
+    query = 'SELECT * WHERE { ?a <http://example.org/p1> <http://example.org/x> . ?b <http://example.org/p2> "b" . }'
+    fizzysearch.metrics.enable()
+    try:
+        result = asyncio.run(
+            fizzysearch.rewrite_async(
+                query,
+                {
+                    "http://example.org/p1": not_indexed,
+                    "http://example.org/p2": nothing,
+                },
+            )
+        )
+    finally:
+        fizzysearch.metrics.disable()
+        fizzysearch.metrics.reset()
+    assert result["rewritten"] == "SELECT * WHERE { VALUES ?a {\n\n}VALUES ?b {\n\n}}"
+    assert [(t["var"], t["reason"], t["results"]) for t in result["truncated"]] == [
+        ("?a", "empty", 0),
+        ("?b", "empty", 0),
+    ]
+
+
+def test_lazy_import():
+    code = "import sys, fizzysearch; from fizzysearch import use_fts; print(sorted(m for m in ('numpy', 'voyager', 'tree_sitter', 'asyncio', 'concurrent.futures') if m in sys.modules))"
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout
+    assert output.strip() == "[]"
+
+
 if __name__ == "__main__":
     pytest.main()
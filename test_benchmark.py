@@ -0,0 +1,51 @@
+import fizzysearch
+import pytest
+
+import fizzysearch.benchmark
+
+
+def test_generate_nt(tmp_path):
+    path = str(tmp_path / "bench.nt")
+    dataset = fizzysearch.benchmark.generate_nt(path, 500)
+    assert dataset["triples"] >= 500
+    with open(path) as F:
+        assert len(F.readlines()) == dataset["triples"]
+    without_blank_nodes = fizzysearch.benchmark.count_triples([path])
+    assert 0 < without_blank_nodes < dataset["triples"]
+    assert (
+        fizzysearch.benchmark.count_triples([path], blank_nodes=True)
+        == dataset["triples"]
+    )
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert fizzysearch.benchmark.percentile(values, 50) == 50
+    assert fizzysearch.benchmark.percentile(values, 99) == 99
+    assert fizzysearch.benchmark.percentile([], 50) is None
+    assert fizzysearch.benchmark.percentile([1, 2, 3, 4, 5], 50) == 3
+    assert fizzysearch.benchmark.percentile([1, 2, 3, 4, 5], 95) == 5
+    assert fizzysearch.benchmark.percentile([1, 2], 50) == 1
+    assert fizzysearch.benchmark.percentile([7], 1) == 7
+
+
+def test_bench_rewrite(tmp_path):
+    path = str(tmp_path / "bench.nt")
+    fizzysearch.benchmark.generate_nt(path, 500)
+    predicate = fizzysearch.benchmark.FTS_PREDICATE
+    queries = fizzysearch.benchmark.make_query_mix([path], [predicate], 20)
+    assert len(queries) == 20
+
+    def handler(varname, value):
+        return {"results": [("<http://example.org/x>",)], "vars": (varname,)}
+
+    report = fizzysearch.benchmark.bench_rewrite(
+        queries, {predicate: handler, "fizzy:fts": handler}, concurrency=2
+    )
+    assert report["queries"] == 20
+    assert report["errors"] == 0
+    assert report["p50_ms"] <= report["p99_ms"]
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -2,6 +2,7 @@ import fizzysearch
 import pytest, os, sqlite3
 
 import fizzysearch.bloomtyper
+from fizzysearch.reader import read_nt
 
 
 @pytest.fixture
@@ -20,5 +21,57 @@ def test_simple(testbloomtyperdb):
     assert "http://www.w3.org/2002/07/owl#Class" in t1
 
 
+@pytest.fixture
+def testbloomtyperstore(tmp_path):
+    store_path = str(tmp_path / "pizza.bloomtyper.store")
+    fizzysearch.bloomtyper.build_bloomtyper_index(["pizza.nt"], None, store_path)
+    yield store_path
+
+
+def test_mapped_checker(testbloomtyperstore):
+    c = fizzysearch.bloomtyper.MappedChecker(testbloomtyperstore)
+    veneziana = "http://www.co-ode.org/ontologies/pizza/pizza.owl#Veneziana"
+    assert "http://www.w3.org/2002/07/owl#Class" in c(veneziana)
+    assert c(veneziana, "http://www.w3.org/2002/07/owl#Class")
+    assert veneziana in c["http://www.w3.org/2002/07/owl#Class"]
+    assert "http://www.w3.org/2002/07/owl#Class" in c
+    assert dict(c)["http://www.w3.org/2002/07/owl#Class"] == 99
+    c.close()
+
+
+def test_mapped_checker_matches_checker(testbloomtyperdb, testbloomtyperstore):
+    checker = fizzysearch.bloomtyper.Checker(testbloomtyperdb)
+    mapped = fizzysearch.bloomtyper.MappedChecker(testbloomtyperstore)
+    assert sorted(checker) == sorted(mapped)
+
+    types = {}
+    for subject, predicate, obj, _ in read_nt(["pizza.nt"]):
+        if predicate == "<http://www.w3.org/1999/02/22-rdf-syntax-ns#type>":
+            types.setdefault(subject.strip("<>"), set()).add(obj.strip("<>"))
+    assert types
+    for subject, subject_types in types.items():
+        assert set(mapped(subject)) >= subject_types
+        assert set(checker(subject)) >= subject_types
+
+    # and the filters are not just full of ones
+    unknown = [f"http://example.org/unknown/{i}" for i in range(1000)]
+    false_positives = sum(len(mapped(value)) for value in unknown)
+    assert false_positives <= 0.01 * len(unknown) * len(dict(mapped))
+    mapped.close()
+
+
+def test_bloom_bits():
+    values = [f"http://example.org/{i}" for i in range(500)]
+    m_bits, k = fizzysearch.bloomtyper.bloom_parameters(len(values))
+    expected = bytearray(m_bits // 8)
+    for value in values:
+        for bit in fizzysearch.bloomtyper.bloom_positions(
+            *fizzysearch.bloomtyper.bloom_hashes(value), k, m_bits
+        ):
+            expected[bit >> 3] |= 1 << (bit & 7)
+    assert fizzysearch.bloomtyper.bloom_bits(values, k, m_bits) == bytes(expected)
+    assert fizzysearch.bloomtyper.bloom_bits([], 1, 64) == bytes(8)
+
+
 if __name__ == "__main__":
     pytest.main()
@@ -0,0 +1,83 @@
+import fizzysearch
+import pytest, gzip, bz2
+
+import fizzysearch.columnar
+from fizzysearch.reader import read_nt
+
+
+@pytest.fixture
+def pizza_triples():
+    return [(s, p, o) for s, p, o, _ in read_nt(["pizza.nt"])]
+
+
+@pytest.mark.parametrize("extension, opener", [(".gz", gzip.open), (".bz2", bz2.open)])
+def test_read_compressed(tmp_path, monkeypatch, pizza_triples, extension, opener):
+    monkeypatch.setenv("FIZZYSEARCH_EXTERNAL_DECOMPRESSORS", "0")
+    path = str(tmp_path / ("pizza.nt" + extension))
+    with open("pizza.nt", "rb") as F, opener(path, "wb") as out:
+        out.write(F.read())
+    assert [(s, p, o) for s, p, o, _ in read_nt([path])] == pizza_triples
+
+
+def test_read_zstd(tmp_path, pizza_triples):
+    zstandard = pytest.importorskip("zstandard")
+    path = str(tmp_path / "pizza.nt.zst")
+    with open("pizza.nt", "rb") as F, open(path, "wb") as out:
+        out.write(zstandard.ZstdCompressor().compress(F.read()))
+    assert [(s, p, o) for s, p, o, _ in read_nt([path])] == pizza_triples
+
+
+def test_columnar_roundtrip(tmp_path, pizza_triples):
+    path = str(tmp_path / "pizza.fzt")
+    count = fizzysearch.columnar.build_columnar(["pizza.nt"], path)
+    assert count == len(list(read_nt(["pizza.nt"], blank_nodes=True)))
+
+    triples = list(read_nt([path]))
+    assert [(s, p, o) for s, p, o, _ in triples] == pizza_triples
+    assert triples[0][3] == "pizza.nt"
+
+    with fizzysearch.columnar.ColumnarTriples(path) as columnar:
+        assert len(columnar) == count
+        s, p, o, f = next(columnar.ids())
+        assert columnar.term(p) == pizza_triples[0][1]
+
+    with_blank_nodes = list(read_nt([path], blank_nodes=True))
+    assert len(with_blank_nodes) == count
+    assert any(s.startswith("_:") for s, _, _, _ in with_blank_nodes)
+
+
+def test_columnar_is_current(tmp_path):
+    source = tmp_path / "pizza.nt"
+    with open("pizza.nt", "rb") as F:
+        source.write_bytes(F.read())
+    path = str(tmp_path / "pizza.fzt")
+    assert not fizzysearch.columnar.columnar_is_current(path, [str(source)])
+
+    fizzysearch.columnar.build_columnar([str(source)], path)
+    assert fizzysearch.columnar.columnar_is_current(path, [str(source)])
+    assert not fizzysearch.columnar.columnar_is_current(path, [str(source), "pizza.nt"])
+
+    with open(source, "ab") as F:
+        F.write(
+            b"<http://example.org/x> <http://example.org/y> <http://example.org/z> .\n"
+        )
+    assert not fizzysearch.columnar.columnar_is_current(path, [str(source)])
+
+
+def test_columnar_failed_build_leaves_no_file(tmp_path, monkeypatch):
+    monkeypatch.setenv("FIZZYSEARCH_EXTERNAL_DECOMPRESSORS", "0")
+    broken = tmp_path / "broken.nt.gz"
+    broken.write_bytes(b"not gzip")
+    path = str(tmp_path / "pizza.fzt")
+    with pytest.raises(OSError):
+        fizzysearch.columnar.build_columnar(["pizza.nt", str(broken)], path)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["broken.nt.gz"]
+
+
+def test_columnar_needs_extension(tmp_path):
+    with pytest.raises(fizzysearch.columnar.ColumnarFormatException):
+        fizzysearch.columnar.build_columnar(["pizza.nt"], str(tmp_path / "pizza.bin"))
+
+
+if __name__ == "__main__":
+    pytest.main()
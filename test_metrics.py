@@ -0,0 +1,54 @@
+import fizzysearch
+import pytest
+
+import fizzysearch.metrics
+
+FTS = "https://fizzysearch.ise.fiz-karlsruhe.de/fts"
+
+
+def handler(varname, value):
+    return {
+        "results": [("<http://example.org/a>",), ("<http://example.org/b>",)],
+        "vars": (varname,),
+    }
+
+
+@pytest.fixture
+def metrics():
+    fizzysearch.metrics.reset()
+    fizzysearch.metrics.enable()
+    yield fizzysearch.metrics
+    fizzysearch.metrics.disable()
+    fizzysearch.metrics.reset()
+
+
+def test_disabled_has_no_stats():
+    query = f'SELECT ?var WHERE {{ ?var <{FTS}> "pizza" . }}'
+    result = fizzysearch.rewrite(query, {FTS: handler})
+    assert "stats" not in result
+    assert fizzysearch.metrics.snapshot() == {"timers": {}, "counters": {}}
+
+
+def test_rewrite_stats(metrics):
+    query = f'SELECT ?var WHERE {{ ?var <{FTS}> "pizza" . }}'
+    result = fizzysearch.rewrite(query, {FTS: handler})
+    assert result["stats"]["parse_seconds"] > 0
+    assert result["stats"]["handlers"][0]["predicate"] == FTS
+    assert result["stats"]["handlers"][0]["results"] == 2
+
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"]["rewrite_queries"] == 1
+    assert snapshot["timers"]["rewrite_parse"]["count"] == 1
+
+
+def test_prometheus_export(metrics):
+    query = f'SELECT ?var WHERE {{ ?var <{FTS}> "pizza" . }}'
+    fizzysearch.rewrite(query, {FTS: handler})
+    text = metrics.to_prometheus()
+    assert "# TYPE fizzysearch_rewrite_parse_seconds summary" in text
+    assert "fizzysearch_rewrite_queries_total 1" in text
+    assert f'fizzysearch_rewrite_handler_results_total{{predicate="{FTS}"}} 2' in text
+
+
+if __name__ == "__main__":
+    pytest.main()